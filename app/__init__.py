@@ -1,18 +1,38 @@
 import os
 from flask import Flask
 from dotenv import load_dotenv
+from flask_compress import Compress
 
 def create_app():
     # load .env so Flask can read config
     load_dotenv()
 
     app = Flask(__name__, static_folder="static", template_folder="templates")
+
+    # faster JSON for every jsonify(); request bodies go through routes._json()
+    from .json_provider import OrjsonProvider
+    app.json = OrjsonProvider(app)
+
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev")
     app.config["MONGODB_URI"] = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
     app.config["MONGODB_DB"] = os.getenv("MONGODB_DB", "todolist")
 
+    # gzip/br responses when the client accepts it (task JSON compresses well)
+    app.config["COMPRESS_MIMETYPES"] = ["application/json", "text/html"]
+    app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+    app.config["COMPRESS_LEVEL"] = 6
+    app.config["COMPRESS_MIN_SIZE"] = 500
+    # leave streamed responses alone: Flask-Compress would read the whole
+    # generator into memory first. list_tasks gzips its own stream instead.
+    app.config["COMPRESS_STREAMS"] = False
+    Compress(app)
+
     # import and attach routes
-    from .routes import bp as routes_bp
+    from .routes import bp as routes_bp, task_html_cache
     app.register_blueprint(routes_bp)
+    app.extensions["task_html"] = task_html_cache()
+
+    # the indexes the API relies on are created by db.tasks_collection() on
+    # first use, so startup never waits on Mongo
 
     return app
@@ -1,35 +1,143 @@
+import re
+from datetime import datetime
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 from bson.objectid import ObjectId
-from flask import current_app, g
+from flask import current_app
+
+# created lazily on first use, then shared by every request in this process.
+# MongoClient is thread-safe and keeps its own connection pool.
+_CLIENT = None
+_DB = None
+_TASKS = None
+_META = None
 
 # create one Mongo client per process
 def _client():
-    if "mongo_client" not in g:
-        g.mongo_client = MongoClient(current_app.config["MONGODB_URI"])
-    return g.mongo_client
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = MongoClient(current_app.config["MONGODB_URI"], maxPoolSize=50)
+    return _CLIENT
+
+def _db():
+    global _DB
+    if _DB is None:
+        _DB = _client()[current_app.config["MONGODB_DB"]]
+    return _DB
 
 def tasks_collection():
-    client = _client()
-    db = client[current_app.config["MONGODB_DB"]]
-    # single "tasks" collection
-    return db.tasks
+    # single "tasks" collection, looked up once per process.
+    # the indexes are created on first use rather than in create_app, so a
+    # Mongo outage doesn't hold up startup. if creating them fails the handle
+    # isn't cached and the next request tries again.
+    global _TASKS
+    if _TASKS is None:
+        col = _db().tasks
+        ensure_indexes(col)
+        _TASKS = col
+    return _TASKS
+
+# list_tasks sort order, and the index that serves it
+LIST_INDEX = [("order", 1), ("created_at", 1)]
+
+def ensure_indexes(col):
+    # matches the list_tasks sort so Mongo walks the index instead of sorting
+    # in memory. create_index is a no-op when the index already exists.
+    col.create_index(LIST_INDEX)
+
+def _meta():
+    # one small document per collection, {"_id": "tasks", "epoch": oid, "version": n}
+    global _META
+    if _META is None:
+        _META = _db().meta
+    return _META
+
+def bump_tasks_version():
+    # call after every write to tasks, including ones made outside this app
+    # (shell, scripts, restores), or polling clients keep getting 304.
+    # the counter goes up on each call, so unlike a max(updated_at) it can't
+    # miss a write that raced another one.
+    try:
+        _meta().update_one(
+            {"_id": "tasks"},
+            {"$inc": {"version": 1}, "$setOnInsert": {"epoch": ObjectId()}},
+            upsert=True,
+        )
+    except PyMongoError as e:
+        # the task write itself went through, don't report it as failed
+        current_app.logger.warning("could not bump tasks version: %s", e)
+
+def tasks_etag():
+    # epoch is new each time the meta doc is created, so a counter that was
+    # reset (doc dropped, db recreated) can't hand out a tag a client holds.
+    # None means there's no meta doc to build a tag from
+    doc = _meta().find_one({"_id": "tasks"})
+    if doc is None:
+        bump_tasks_version()
+        doc = _meta().find_one({"_id": "tasks"})
+        if doc is None:
+            return None
+    return f"{doc['epoch']}-{doc['version']}"
+
+def utcnow():
+    # BSON dates only keep milliseconds. trimming here means the value a
+    # response hands back is the same one a later read returns
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+_OID_RE = re.compile(r"[0-9a-fA-F]{24}")
 
 def to_object_id(id_str):
     # convert safe. raises ValueError if bad id
-    try:
-        return ObjectId(id_str)
-    except Exception as e:
-        raise ValueError("Invalid id") from e
+    # cheap regex check first so a good id never goes through an exception
+    if not _OID_RE.fullmatch(id_str):
+        raise ValueError("Invalid id")
+    return ObjectId(id_str)
+
+# fields serialize() emits besides id/title, with the value for a missing one.
+# the projections below come from the same tables so they can't drift apart
+TASK_FIELDS = {
+    "notes": "",
+    "priority": "normal",
+    "completed": False,
+    "created_at": None,
+    "updated_at": None,
+    "due_date": None,
+}
+
+# what the list page renders; notes are only shown on the detail page
+LIST_FIELDS = {f: TASK_FIELDS[f] for f in ("priority", "completed", "created_at", "due_date")}
+
+# for queries that only need to hand a task back
+TASK_PROJECTION = {"title": 1, **dict.fromkeys(TASK_FIELDS, 1)}
+# list_tasks also sorts on order
+LIST_PROJECTION = {"title": 1, "order": 1, **dict.fromkeys(LIST_FIELDS, 1)}
+
+# detail page flag: not completed and due date before today. due_date is a
+# yyyy-mm-dd string, so comparing it to today's date as a string is enough
+# and Mongo does it server-side. $$NOW is UTC.
+OVERDUE_EXPR = {
+    "$and": [
+        {"$not": [{"$ifNull": ["$completed", False]}]},
+        # missing or malformed due dates are never overdue. non-strings are
+        # swapped for "" first because $regexMatch errors on them
+        {"$regexMatch": {
+            "input": {"$cond": [{"$eq": [{"$type": "$due_date"}, "string"]}, "$due_date", ""]},
+            "regex": r"^\d{4}-\d{2}-\d{2}$",
+        }},
+        {"$lt": ["$due_date", {"$dateToString": {"format": "%Y-%m-%d", "date": "$$NOW"}}]},
+    ]
+}
 
-def serialize(task_doc):
+def serialize(task_doc, fields=TASK_FIELDS, _get=dict.get):
     # convert Mongo ObjectId to string for JSON
-    return {
-        "id": str(task_doc["_id"]),
-        "title": task_doc["title"],
-        "notes": task_doc.get("notes", ""),
-        "priority": task_doc.get("priority", "normal"),
-        "completed": bool(task_doc.get("completed", False)),
-        "created_at": task_doc.get("created_at"),
-        "updated_at": task_doc.get("updated_at"),
-        "due_date": task_doc.get("due_date"),
-    }
+    # created_at/updated_at stay datetimes, orjson writes them as ISO-8601
+    # pass LIST_FIELDS for LIST_PROJECTION docs, so fields that weren't
+    # fetched are left out rather than reported as empty.
+    # _get is bound once at definition time, so list_tasks doesn't look up
+    # task_doc.get for every field of every document
+    out = {"id": str(task_doc["_id"]), "title": task_doc["title"]}
+    for name, default in fields.items():
+        out[name] = _get(task_doc, name, default)
+    out["completed"] = bool(out["completed"])
+    return out
@@ -0,0 +1,12 @@
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider for jsonify/get_json backed by orjson instead of stdlib json."""
+
+    def dumps(self, obj, **kwargs):
+        # orjson handles datetime natively; anything else falls back to Flask's default
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
@@ -1,14 +1,28 @@
 # app/routes.py
-from datetime import datetime, date  
+import time
+import zlib
+from datetime import datetime
+from functools import lru_cache
 from bson.objectid import ObjectId
-from flask import Blueprint, render_template, request, jsonify, abort
-from .db import tasks_collection, to_object_id, serialize
+import orjson
+from flask import Blueprint, Response, current_app, render_template, request, jsonify, abort, stream_with_context
+from .db import tasks_collection, ensure_indexes, tasks_etag, bump_tasks_version, utcnow, to_object_id, serialize, TASK_PROJECTION, LIST_FIELDS, LIST_PROJECTION, LIST_INDEX, OVERDUE_EXPR
 from .schemas import validate_create, validate_update
-from pymongo.errors import PyMongoError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
 
 # Blueprint name "routes" prefixes endpoints as routes.<endpoint>
 bp = Blueprint("routes", __name__)
 
+def _json():
+    """Request body decoded with orjson; {} unless it's a JSON object."""
+    try:
+        data = orjson.loads(request.get_data() or b"{}")
+    except orjson.JSONDecodeError:
+        return {}
+    # the validators and handlers expect a dict, a list or string body would crash them
+    return data if isinstance(data, dict) else {}
+
 # ---------------- HTML PAGES ----------------
 
 @bp.get("/", endpoint="index")  # expose endpoint as routes.index
@@ -30,68 +44,141 @@ def task_detail_page(id):
     except ValueError:
         abort(404)
 
-    doc = col.find_one({"_id": oid})
-    if not doc:
+    # let Mongo work out the overdue flag alongside the fields we render
+    docs = list(col.aggregate([
+        {"$match": {"_id": oid}},
+        {"$project": {**TASK_PROJECTION, "is_overdue": OVERDUE_EXPR}},
+    ]))
+    if not docs:
         abort(404)
 
-    task = serialize(doc)
+    t = serialize(docs[0])
+    # older documents may hold a non-string due_date, which can't be a cache key
+    due_date = t["due_date"] if isinstance(t["due_date"], str) else None
+    return current_app.extensions["task_html"](
+        t["id"], t["updated_at"], t["title"], t["notes"], t["priority"],
+        t["completed"], due_date, docs[0]["is_overdue"],
+    )
 
-    # Optional: compute overdue flag (not completed and due date in the past)
-    is_overdue = False
-    due = task.get("due_date")
-    if due and not task.get("completed"):
-        try:
-            y, m, d = map(int, due.split("-"))
-            is_overdue = date(y, m, d) < date.today()
-        except Exception:
-            # if due is malformed, just ignore and leave it not-overdue
-            pass
+def task_html_cache():
+    """New LRU of rendered detail pages; create_app gives each app its own."""
+    return lru_cache(maxsize=2048)(_render_task_html)
 
+def _render_task_html(id, updated_at, title, notes, priority, completed, due_date, is_overdue):
+    # every value the page shows is part of the cache key, so an edit (new
+    # updated_at) or the due date passing (is_overdue flips) renders again
+    task = {
+        "id": id,
+        "title": title,
+        "notes": notes,
+        "priority": priority,
+        "completed": completed,
+        "updated_at": updated_at,
+        "due_date": due_date,
+    }
     return render_template("task_detail.html", task=task, is_overdue=is_overdue)
 
 # ---------------- JSON API ----------------
 
+def _list_cursor(col, hint):
+    # list documents are small, so ask for big batches (fewer getMore
+    # round trips) and pin the sort index so the planner can't drift
+    cursor = col.find({}, projection=LIST_PROJECTION, batch_size=1000)
+    if hint:
+        cursor = cursor.hint(LIST_INDEX)
+    return cursor.sort(LIST_INDEX)
+
 @bp.get("/api/tasks")
 def list_tasks():
     """Return all tasks ordered by 'order' then 'created_at'."""
     try:
+        etag = tasks_etag()
+        # nothing changed since the client's last poll, skip the listing.
+        # the tag is weak because it covers both the gzip and plain body
+        if etag and request.if_none_match.contains_weak(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag, weak=True)
+            resp.vary.add("Accept-Encoding")
+            return resp
         col = tasks_collection()
-        docs = col.find().sort([("order", 1), ("created_at", 1)])
-        return jsonify([serialize(d) for d in docs]), 200
+        # pull the first document here so db errors still turn into a 500
+        # instead of breaking a response that already started streaming
+        try:
+            docs = _list_cursor(col, hint=True)
+            first = next(docs, None)
+        except OperationFailure as e:
+            # BadValue: the hinted index was dropped after tasks_collection()
+            # created it. put it back for the next request, and serve this one
+            # unhinted (same sort, just not pinned)
+            if e.code != 2:
+                raise
+            try:
+                ensure_indexes(col)
+            except PyMongoError as ie:
+                current_app.logger.warning("could not recreate indexes: %s", ie)
+            docs = _list_cursor(col, hint=False)
+            first = next(docs, None)
     except PyMongoError as e:
         return jsonify({"error": "db_error", "detail": str(e)}), 500
     except Exception as e:
         return jsonify({"error": "server_error", "detail": str(e)}), 500
 
+    def generate():
+        # write the array one document at a time instead of building it all up
+        yield b"["
+        if first is not None:
+            yield orjson.dumps(serialize(first, LIST_FIELDS))
+            for d in docs:
+                yield b"," + orjson.dumps(serialize(d, LIST_FIELDS))
+        yield b"]"
+
+    def generate_gzip():
+        # Flask-Compress skips streams (COMPRESS_STREAMS=False), so gzip here,
+        # chunk by chunk, without holding the whole body
+        gz = zlib.compressobj(current_app.config["COMPRESS_LEVEL"], zlib.DEFLATED, 31)
+        for chunk in generate():
+            out = gz.compress(chunk)
+            if out:
+                yield out
+        yield gz.flush()
+
+    gzip = request.accept_encodings["gzip"] > 0
+    body = generate_gzip() if gzip else generate()
+    resp = Response(stream_with_context(body), status=200, mimetype="application/json")
+    if gzip:
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.vary.add("Accept-Encoding")
+    if etag:
+        resp.set_etag(etag, weak=True)
+    return resp
+
 @bp.post("/api/tasks")
 def create_task():
     """Create a task. Body is JSON validated by schemas.validate_create."""
-    payload = request.get_json(force=True, silent=True) or {}
+    payload = _json()
     data, errors = validate_create(payload)
     if errors:
         return jsonify({"errors": errors}), 400
 
-    now = datetime.utcnow().isoformat()
+    now = utcnow()
     data["created_at"] = now
     data["updated_at"] = now
 
-    if payload.get("due_date"):
-        data["due_date"] = payload["due_date"]
-
     col = tasks_collection()
-    res = col.insert_one(data)
-    created = col.find_one({"_id": res.inserted_id})
-    return jsonify(serialize(created)), 201
+    # insert_one sets data["_id"], so we can return data without reading it back
+    col.insert_one(data)
+    bump_tasks_version()
+    return jsonify(serialize(data)), 201
 
 @bp.patch("/api/tasks/<id>")
 def update_task(id):
     """Partial update. Body validated by schemas.validate_update."""
-    payload = request.get_json(force=True, silent=True) or {}
+    payload = _json()
     doc, errors = validate_update(payload)
     if errors:
         return jsonify({"errors": errors}), 400
 
-    doc["updated_at"] = datetime.utcnow().isoformat()
+    doc["updated_at"] = utcnow()
 
     col = tasks_collection()
     try:
@@ -99,9 +186,12 @@ def update_task(id):
     except ValueError:
         return jsonify({"error": "invalid id"}), 400
 
-    res = col.find_one_and_update({"_id": oid}, {"$set": doc}, return_document=True)
+    res = col.find_one_and_update(
+        {"_id": oid}, {"$set": doc}, projection=TASK_PROJECTION, return_document=True
+    )
     if not res:
         return jsonify({"error": "not found"}), 404
+    bump_tasks_version()
     return jsonify(serialize(res)), 200
 
 @bp.patch("/api/tasks/reorder")
@@ -110,7 +200,7 @@ def reorder_tasks():
     Persist a new order for all tasks.
     Body: { "ids": ["<id1>", "<id2>", ...] } in the EXACT new order (top→bottom).
     """
-    data = request.get_json(force=True, silent=True) or {}
+    data = _json()
     ids = data.get("ids")
     if not isinstance(ids, list) or not ids:
         return jsonify({"error": "ids must be a non-empty list"}), 400
@@ -122,10 +212,20 @@ def reorder_tasks():
         return jsonify({"error": f"bad id in list: {e}"}), 400
 
     col = tasks_collection()
-    now = datetime.utcnow().isoformat()
+    now = utcnow()
 
-    for i, oid in enumerate(oids):
-        col.update_one({"_id": oid}, {"$set": {"order": i, "updated_at": now}})
+    # one round trip for the whole list instead of one per task
+    ops = [UpdateOne({"_id": oid}, {"$set": {"order": i, "updated_at": now}})
+           for i, oid in enumerate(oids)]
+    # wait for the write: the client reloads the list on an error, and a
+    # list fetched right after this must already see the new order
+    try:
+        col.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    finally:
+        # unordered, so some updates may have landed even on an error
+        bump_tasks_version()
 
     return jsonify({"ok": True}), 200
 
@@ -141,6 +241,7 @@ def delete_task(id):
     res = col.delete_one({"_id": oid})
     if res.deleted_count == 0:
         return jsonify({"error": "not found"}), 404
+    bump_tasks_version()
     return jsonify({"ok": True}), 200
 
 # ---------------- ADMIN / HEALTH ----------------
@@ -149,16 +250,66 @@ def delete_task(id):
 def seed_order_once():
     """Initialize 'order' for existing tasks based on created_at ascending."""
     col = tasks_collection()
-    docs = list(col.find().sort("created_at", 1))
-    for i, d in enumerate(docs):
-        col.update_one({"_id": d["_id"]}, {"$set": {"order": i}})
-    return jsonify({"ok": True, "updated": len(docs)}), 200
+    docs = col.find({}, projection={"_id": 1, "order": 1}).sort("created_at", 1)
+    # only touch tasks whose order actually changes
+    ops = [UpdateOne({"_id": d["_id"]}, {"$set": {"order": i}})
+           for i, d in enumerate(docs) if d.get("order") != i]
+    # bulk_write refuses an empty list
+    if ops:
+        try:
+            col.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            return jsonify({"error": "db_error", "detail": str(e)}), 500
+        finally:
+            bump_tasks_version()
+    return jsonify({"ok": True, "updated": len(ops)}), 200
+
+@bp.post("/admin/migrate-dates")
+def migrate_dates_once():
+    """Convert created_at/updated_at left as ISO strings by older versions into dates."""
+    col = tasks_collection()
+    fields = ("created_at", "updated_at")
+    docs = col.find({"$or": [{f: {"$type": "string"}} for f in fields]},
+                    projection={f: 1 for f in fields})
+    ops = []
+    for d in docs:
+        dates = {}
+        for f in fields:
+            if isinstance(d.get(f), str):
+                try:
+                    dt = datetime.fromisoformat(d[f])
+                except ValueError:
+                    # leave malformed values for someone to look at by hand
+                    continue
+                dates[f] = dt.replace(microsecond=dt.microsecond // 1000 * 1000)
+        if dates:
+            ops.append(UpdateOne({"_id": d["_id"]}, {"$set": dates}))
+    # bulk_write refuses an empty list
+    if ops:
+        try:
+            col.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            return jsonify({"error": "db_error", "detail": str(e)}), 500
+        finally:
+            bump_tasks_version()
+    return jsonify({"ok": True, "updated": len(ops)}), 200
+
+# last ping result, reused for a few seconds so frequent probes don't hit Mongo
+HEALTH_TTL = 5
+_HEALTH = {"t": None, "ok": True, "error": None}
 
 @bp.get("/healthz")
 def healthz():
     """App and DB health check."""
-    try:
-        tasks_collection().database.command("ping")
+    now = time.monotonic()
+    if _HEALTH["t"] is None or now - _HEALTH["t"] >= HEALTH_TTL:
+        try:
+            tasks_collection().database.command("ping")
+            _HEALTH.update(ok=True, error=None)
+        except Exception as e:
+            _HEALTH.update(ok=False, error=str(e))
+        _HEALTH["t"] = now
+
+    if _HEALTH["ok"]:
         return jsonify({"ok": True}), 200
-    except Exception as e:
-        return jsonify({"ok": False, "error": str(e)}), 500
\ No newline at end of file
+    return jsonify({"ok": False, "error": _HEALTH["error"]}), 500
\ No newline at end of file
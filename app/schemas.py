@@ -1,38 +1,69 @@
 # tiny validation helpers. keep it beginner-friendly.
 
-PRIORITIES = {"low", "normal", "high"}
+PRIORITIES = frozenset({"low", "normal", "high"})
+
+def _priority(value):
+    # lowercase only when the value isn't already one of ours
+    return value if value in PRIORITIES else value.lower()
 
 def validate_create(payload):
     errors = []
     title = (payload.get("title") or "").strip()
     if not title:
         errors.append("title is required")
-    priority = (payload.get("priority") or "normal").lower()
+    priority = _priority(payload.get("priority") or "normal")
     if priority not in PRIORITIES:
         errors.append("priority must be low, normal, or high")
+    due_date = payload.get("due_date")
+    if due_date and not isinstance(due_date, str):
+        errors.append("due_date must be a yyyy-mm-dd string")
     if errors:
         return None, errors
-    return {
+    doc = {
         "title": title,
         "notes": (payload.get("notes") or "").strip(),
         "priority": priority,
         "completed": False,
-    }, None
+    }
+    if due_date:
+        doc["due_date"] = due_date
+    return doc, None
+
+# each update validator returns (value, error)
+def _v_title(value):
+    title = (value or "").strip()
+    if not title:
+        return None, "title cannot be empty"
+    return title, None
+
+def _v_notes(value):
+    return (value or "").strip(), None
+
+def _v_priority(value):
+    p = _priority(value or "")
+    if p not in PRIORITIES:
+        return None, "priority must be low, normal, or high"
+    return p, None
+
+def _v_completed(value):
+    return bool(value), None
+
+_UPDATE_VALIDATORS = {
+    "title": _v_title,
+    "notes": _v_notes,
+    "priority": _v_priority,
+    "completed": _v_completed,
+}
 
 def validate_update(payload):
     doc = {}
-    if "title" in payload:
-        title = (payload.get("title") or "").strip()
-        if not title:
-            return None, ["title cannot be empty"]
-        doc["title"] = title
-    if "notes" in payload:
-        doc["notes"] = (payload.get("notes") or "").strip()
-    if "priority" in payload:
-        p = (payload.get("priority") or "").lower()
-        if p not in PRIORITIES:
-            return None, ["priority must be low, normal, or high"]
-        doc["priority"] = p
-    if "completed" in payload:
-        doc["completed"] = bool(payload.get("completed"))
+    # only look at the keys the client actually sent, unknown keys are ignored
+    for key, value in payload.items():
+        fn = _UPDATE_VALIDATORS.get(key)
+        if fn is None:
+            continue
+        value, error = fn(value)
+        if error:
+            return None, [error]
+        doc[key] = value
     return doc, None
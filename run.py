@@ -3,5 +3,6 @@ from app import create_app
 app = create_app()
 
 if __name__ == "__main__":
+    # dev server only, use wsgi.py + gunicorn in production
     # debug auto-reloads on code changes
     app.run(host="127.0.0.1", port=5000, debug=True)
@@ -0,0 +1,7 @@
+# production entry point:
+#   gunicorn -k gevent -w 2 --worker-connections 1000 wsgi:app
+# the gevent worker patches sockets, so a request waiting on Mongo
+# lets the other requests in the same worker keep going.
+from app import create_app
+
+app = create_app()